@@ -11,11 +11,11 @@
 
 
 from spyne.protocol.http import HttpRpc
-from spyne.protocol.json import JsonDocument
 from spyne.util import memoize
 
 from neurons import Application
 
+from jmapd.protocol import JmapJsonDocument
 from jmapd.service.core import CoreReaderServices
 from jmapd.service.mail import MailWriterServices, MailReaderServices
 
@@ -32,7 +32,7 @@ def start_core(config):
             [CoreReaderServices],
             tns='https://jmap.io/', name='CoreServices',
             in_protocol=HttpRpc(validator='soft'),
-            out_protocol=JsonDocument(),
+            out_protocol=JmapJsonDocument(),
             config=config,
         ),
         'api': Application(
@@ -40,8 +40,8 @@ def start_core(config):
                 MailReaderServices, MailWriterServices,
             ],
             tns='https://jmap.io/', name='ApiServices',
-            in_protocol=JsonDocument(validator='soft'),
-            out_protocol=JsonDocument(),
+            in_protocol=JmapJsonDocument(validator='soft'),
+            out_protocol=JmapJsonDocument(),
             config=config,
         )
     })
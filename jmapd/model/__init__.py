@@ -11,6 +11,6 @@
 
 from __future__ import unicode_literals
 
-from ._base import UtcDate, JmapId
+from ._base import UtcDate, JmapId, JmapMap, JmapSet, validate_id
 from .log import LogEntry
 from .core import Capabilities
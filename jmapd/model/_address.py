@@ -0,0 +1,50 @@
+# encoding: utf8
+#
+# This file is part of the jmapd project at https://github.com/arskom/jmapd.
+#
+# jmapd (c) 2020 and beyond, Arskom Ltd. All rights reserved.
+#
+# This file is subject to the terms of the 3-clause BSD license, which can be
+# found in the LICENSE file distributed with this file. Alternatively, you can
+# obtain a copy from the repository root cited above.
+#
+
+from spyne import M, ComplexModel, Unicode, Array
+
+
+# These are instantiated once per header and recipient. They don't declare
+# __slots__ because ComplexModel keeps field values in the instance __dict__
+# (its __init__ and __repr__ read it directly) and its base classes aren't
+# slotted, so __slots__ would only make the instances bigger.
+
+
+class EmailHeader(ComplexModel):
+    _type_info = [
+        ('key', M(Unicode(default=''))),
+        # sub_name used just to be consistent with EmailAddressGroup
+        ('value', M(Unicode(default='', sub_name='email'))),
+    ]
+
+
+class EmailAddress(ComplexModel):
+    _type_info = [
+        ('name', Unicode(default='')),
+        # sub_name used just to be consistent with EmailAddressGroup
+        ('address', M(Unicode(default='', sub_name='email'))),
+    ]
+
+    def __eq__(self, other):
+        return self.name == other.name and self.address == other.address
+
+    def __ne__(self, other):
+        return self.name != other.name or self.address != other.address
+
+    def is_empty(self):
+        return not (self.name or self.address)
+
+
+class EmailAddressGroup(ComplexModel):
+    _type_info = [
+        ('name', Unicode(default='')),
+        ('addresses', Array(M(Unicode(default='')))),
+    ]
@@ -9,7 +9,9 @@
 # obtain a copy from the repository root cited above.
 #
 
-from spyne import M, Unicode, DateTime
+import re
+
+from spyne import M, Unicode, DateTime, AnyDict
 
 
 UtcDate = DateTime(timezone=False)
@@ -37,3 +39,40 @@ UtcDate = DateTime(timezone=False)
 #
 
 JmapId = M(Unicode(255, pattern='[a-z][A-Za-z0-9_-]+'))
+
+# JmapId's pattern and length limit in one regex, for values that aren't
+# validated by spyne, e.g. the keys of a JmapSet.
+_ID_RE = re.compile(r'[a-z][A-Za-z0-9_-]{1,254}\Z')
+
+
+def validate_id(value):
+    """Returns True if ``value`` is a valid :data:`JmapId`."""
+
+    return _ID_RE.match(value) is not None
+
+
+class JmapMap(AnyDict):
+    """A JSON object with arbitrary keys whose values are all of the type given
+    in ``value_type``. The protocols in :mod:`jmapd.protocol` use it to
+    serialize values in a single pass over ``dict.items()`` instead of passing
+    the dict through like ``AnyDict`` does. A ``value_type`` of ``None`` means
+    the values are passed through as they are.
+    """
+
+    class Attributes(AnyDict.Attributes):
+        value_type = None
+
+
+class JmapSet(AnyDict):
+    """A set of strings, which JMAP represents as a JSON object whose values
+    are all ``true``. The native value is a ``frozenset`` of the keys; the
+    protocols in :mod:`jmapd.protocol` build the object only when
+    serializing.
+    """
+
+    Value = frozenset
+
+    class Attributes(AnyDict.Attributes):
+        key_validator = None
+        """A callable that returns True for valid keys, e.g.
+        :func:`validate_id`. It's only called under soft validation."""
@@ -0,0 +1,359 @@
+# encoding: utf8
+#
+# This file is part of the jmapd project at https://github.com/arskom/jmapd.
+#
+# jmapd (c) 2020 and beyond, Arskom Ltd. All rights reserved.
+#
+# This file is subject to the terms of the 3-clause BSD license, which can be
+# found in the LICENSE file distributed with this file. Alternatively, you can
+# obtain a copy from the repository root cited above.
+#
+
+from array import array
+
+from spyne import M, ComplexModel, UnsignedInteger, Unicode, Array, \
+    SelfReference, Boolean, Integer
+
+from jmapd.model import JmapId
+from jmapd.model._address import EmailHeader
+
+
+class EmailBodyValue(ComplexModel):
+    _type_info = [
+        ('value', Unicode(
+            doc="String The value of the body part after decoding "
+                "Content-Transfer-Encoding and the Content-Type charset, "
+                "if both known to the server, and with any CRLF replaced with "
+                "a single LF. The server MAY use heuristics to determine the "
+                "charset to use for decoding if the charset is unknown, "
+                "no charset is given, or it believes the charset given is "
+                "incorrect. Decoding is best effort; the server SHOULD insert "
+                "the unicode replacement character (U+FFFD) and continue when "
+                "a malformed section is encountered.\n\n"
+
+                "Note that due to the charset decoding and line ending "
+                "normalisation, the length of this string will probably not "
+                "be exactly the same as the size property on the "
+                "corresponding EmailBodyPart."
+        )),
+
+        ('is_encoding_problem', M(Boolean(
+            sub_name='isEncodingProblem', default=False,
+            doc="(default: false) This is true if malformed sections "
+                "were found while decoding the charset, or the charset was "
+                "unknown, or the content-transfer-encoding was unknown.",
+        ))),
+
+        ('is_truncated', M(Boolean(
+            sub_name='isTruncated', default=False,
+            doc="(default: false) This is true if the value has been "
+                "truncated.",
+        ))),
+    ]
+
+
+class EmailBodyPart(ComplexModel):
+    # see JmapJsonDocument._get_fast_serializer
+    _fast_dict = True
+
+    _type_info = [
+        ('part_id', Unicode(
+            sub_name='partId',
+            doc="Identifies this part uniquely within the Email. This is "
+                "scoped to the emailId and has no meaning outside of the "
+                "JMAP Email object representation. This is null if, and only "
+                "if, the part is of type multipart."
+        )),
+
+        ('blob_id', JmapId(
+            sub_name='blobId',
+            doc="Id|null The id representing the raw octets of the contents "
+                "of the part, after decoding any known "
+                "Content-Transfer-Encoding (as defined in [@!RFC2045]), or "
+                "null if, and only if, the part is of type multipart. Note "
+                "that two parts may be transfer-encoded differently but have "
+                "the same blob id if their decoded octets are identical and "
+                "the server is using a secure hash of the data for the blob "
+                "id. If the transfer encoding is unknown, it is treated as "
+                "though it had no transfer encoding."
+        )),
+
+        ('size', M(UnsignedInteger(
+            sub_name='size',
+            doc="UnsignedInt The size, in octets, of the raw data after "
+                "content transfer decoding (as referenced by the blobId, "
+                "i.e., the number of octets in the file the user would "
+                "download)."
+        ))),
+
+        ('headers', Array(EmailHeader,
+            sub_name='headers',
+            doc="This is a list of all header fields in the "
+                "part, in the order they appear in the message. The values "
+                "are in Raw form."
+        )),
+
+        ('name', Unicode(
+            sub_name='name',
+            doc="This is the decoded filename parameter of the "
+                "Content-Disposition header field per [@!RFC2231], or (for "
+                "compatibility with existing systems) if not present, "
+                "then it’s the decoded name parameter of the Content-Type "
+                "header field per [@!RFC2047]."
+        )),
+
+        ('type', M(Unicode(
+            sub_name='type',
+            doc='String The value of the Content-Type header field of the '
+                'part, if present; otherwise, the implicit type as per the '
+                'MIME standard (text/plain or message/rfc822 if inside a '
+                'multipart/digest). CFWS is removed and any parameters are '
+                'stripped.'
+        ))),
+
+        ('charset', Unicode(
+            sub_name='charset',
+            doc="The value of the charset parameter of the Content-Type "
+                "header field, if present, or null if the header field is "
+                "present but not of type text. If there is no Content-Type "
+                "header field, or it exists and is of type text but has no "
+                "charset parameter, this is the implicit charset as per the "
+                "MIME standard: us-ascii."
+        )),
+
+        ('disposition', Unicode(
+            sub_name='disposition',
+            doc="The value of the Content-Disposition header "
+                "field of the part, if present; otherwise, it’s null. CFWS is "
+                "removed and any parameters are stripped."
+        )),
+
+        ('cid', Unicode(
+            sub_name='cid',
+            doc="The value of the Content-Id header field of the "
+                "part, if present; otherwise it’s null. CFWS and surrounding "
+                "angle brackets (<>) are removed. This may be used to "
+                "reference the content from within a text/html body part HTML "
+                "using the cid: protocol, as defined in [@!RFC2392]."
+        )),
+
+        ('language', Array(Unicode,
+            sub_name='language',
+            doc="The list of language tags, as defined in ["
+                "@!RFC3282], in the Content-Language header field of the "
+                "part, if present."
+        )),
+
+        ('location', Unicode(
+            sub_name='location',
+            doc="The URI, as defined in [@!RFC2557], in the "
+                "Content-Location header field of the part, if present."
+        )),
+
+        ('subParts', Array(SelfReference,
+            sub_name='subParts',
+            doc="If the type is multipart, this contains the body parts of "
+                "each child."
+        )),
+    ]
+
+    def walk_body(self):
+        """Yields this part and all parts below it, depth-first and in the
+        order they appear in the message. Uses an explicit stack so deep
+        multipart nesting costs no Python frames."""
+
+        stack = [self]
+        pop, push = stack.pop, stack.extend
+        while stack:
+            part = pop()
+            yield part
+
+            if part.subParts:
+                push(reversed(part.subParts))
+
+
+_INLINE_MEDIA_PREFIXES = ('image/', 'audio/', 'video/')
+
+# Slots of the frames that get_derived_rows() keeps on its stack, one frame
+# per open multipart. Each frame holds what one level of the recursive
+# reference algorithm in RFC 8621 keeps in its arguments and locals.
+(
+    _FRAME_ROW,  # row of the multipart part, -1 for the top level
+    _FRAME_SUBTYPE,  # multipart subtype, e.g. 'alternative'
+    _FRAME_IN_ALTERNATIVE,  # True when inside any multipart/alternative
+    _FRAME_TEXT,  # textBody rows, None when this branch only has html
+    _FRAME_HTML,  # htmlBody rows, None when this branch only has text
+    _FRAME_TEXT_LEN,  # len(textBody) when the frame was opened, -1 if None
+    _FRAME_HTML_LEN,  # len(htmlBody) when the frame was opened, -1 if None
+    _FRAME_POSITION,  # position of the next child within the multipart
+) = range(8)
+
+
+def _fix_alternative(frame):
+    # When a multipart/alternative only had one of the text or html versions,
+    # that version is used for both.
+    text = frame[_FRAME_TEXT]
+    html = frame[_FRAME_HTML]
+    if frame[_FRAME_SUBTYPE] != 'alternative' or text is None or html is None:
+        return
+
+    text_len = frame[_FRAME_TEXT_LEN]
+    html_len = frame[_FRAME_HTML_LEN]
+
+    if text_len == len(text) and html_len != len(html):
+        text.extend(html[html_len:])
+
+    if html_len == len(html) and text_len != len(text):
+        html.extend(text[text_len:])
+
+
+class EmailBodyPartTable(ComplexModel):
+    """A flat view of one or more EmailBodyPart trees, with parts stored in
+    depth-first order. Row ``i`` describes ``parts[i]`` and ``parent_idx[i]``
+    is the row of its parent, or -1 for a root part. The remaining columns
+    copy the fields that are needed for deriving ``textBody``, ``htmlBody``
+    and ``attachments`` so that those passes don't have to chase
+    ``subParts`` references.
+
+    This is an internal structure; the wire format is still the tree, see
+    :meth:`from_tree` and :meth:`as_tree`.
+    """
+
+    _type_info = [
+        ('parts', Array(EmailBodyPart)),
+        ('parent_idx', Array(Integer)),
+        ('types', Array(Unicode)),
+        ('dispositions', Array(Unicode)),
+        ('names', Array(Unicode)),
+    ]
+
+    @classmethod
+    def from_tree(cls, roots):
+        parts = []
+        parent_idx = array('i')
+
+        stack = [(part, -1) for part in reversed(roots)]
+        pop, push = stack.pop, stack.extend
+        while stack:
+            part, parent = pop()
+
+            parent_idx.append(parent)
+            parts.append(part)
+
+            if part.subParts:
+                idx = len(parts) - 1
+                push([(sub, idx) for sub in reversed(part.subParts)])
+
+        return cls(
+            parts=parts,
+            parent_idx=parent_idx,
+            types=[part.type for part in parts],
+            dispositions=[part.disposition for part in parts],
+            names=[part.name for part in parts],
+        )
+
+    def as_tree(self):
+        roots = []
+        children = [[] for _ in self.parts]
+        for part, parent in zip(self.parts, self.parent_idx):
+            if parent < 0:
+                roots.append(part)
+            else:
+                children[parent].append(part)
+
+        for part, sub in zip(self.parts, children):
+            if sub or part.subParts is not None:
+                part.subParts = sub
+
+        return roots
+
+    def get_derived_rows(self):
+        """Returns the rows that make up ``textBody``, ``htmlBody`` and
+        ``attachments`` as three ``array('i')`` instances, following the
+        algorithm in RFC 8621 section 4.1.4.
+
+        The reference algorithm recurses into ``subParts``. Here the rows are
+        already in depth-first order, so it's done in a single pass over the
+        table with an explicit stack standing in for the recursion.
+        """
+
+        text_body = array('i')
+        html_body = array('i')
+        attachments = array('i')
+
+        # see the _FRAME_* constants for the layout of the frames
+        stack = [[-1, 'mixed', False, text_body, html_body, 0, 0, 0]]
+        push, pop = stack.append, stack.pop
+
+        # rows that opened a frame, i.e. multipart parts
+        is_frame = bytearray(len(self.parts))
+
+        for i, (parent, type_, disposition, name) in enumerate(zip(
+                  self.parent_idx, self.types, self.dispositions, self.names)):
+            if parent >= 0 and not is_frame[parent]:
+                # The reference algorithm treats parts that aren't
+                # multipart/ as leaves even if they have subParts, e.g.
+                # message/rfc822, so their descendants are skipped.
+                continue
+
+            while stack[-1][_FRAME_ROW] != parent:
+                _fix_alternative(pop())
+
+            frame = stack[-1]
+            multipart_type = frame[_FRAME_SUBTYPE]
+            in_alternative = frame[_FRAME_IN_ALTERNATIVE]
+            text = frame[_FRAME_TEXT]
+            html = frame[_FRAME_HTML]
+            position = frame[_FRAME_POSITION]
+            frame[_FRAME_POSITION] += 1
+
+            type_ = type_ or ''
+            is_media = type_.startswith(_INLINE_MEDIA_PREFIXES)
+
+            if type_.startswith('multipart/'):
+                subtype = type_[10:]
+                is_frame[i] = 1
+                push([i, subtype, in_alternative or subtype == 'alternative',
+                    text, html,
+                    -1 if text is None else len(text),
+                    -1 if html is None else len(html),
+                    0,
+                ])
+
+            elif disposition != 'attachment' \
+                    and (is_media or type_ in ('text/plain', 'text/html')) \
+                    and (position == 0 or (multipart_type != 'related'
+                                                and (is_media or not name))):
+                if multipart_type == 'alternative':
+                    # either list can be None here if an enclosing
+                    # alternative has already picked the other version.
+                    if type_ == 'text/plain':
+                        if text is not None:
+                            text.append(i)
+                    elif type_ == 'text/html':
+                        if html is not None:
+                            html.append(i)
+                    else:
+                        attachments.append(i)
+                    continue
+
+                if in_alternative:
+                    if type_ == 'text/plain':
+                        html = frame[_FRAME_HTML] = None
+                    elif type_ == 'text/html':
+                        text = frame[_FRAME_TEXT] = None
+
+                if text is not None:
+                    text.append(i)
+                if html is not None:
+                    html.append(i)
+                if (text is None or html is None) and is_media:
+                    attachments.append(i)
+
+            else:
+                attachments.append(i)
+
+        while stack:
+            _fix_alternative(pop())
+
+        return text_body, html_body, attachments
@@ -0,0 +1,347 @@
+# encoding: utf8
+#
+# This file is part of the jmapd project at https://github.com/arskom/jmapd.
+#
+# jmapd (c) 2020 and beyond, Arskom Ltd. All rights reserved.
+#
+# This file is subject to the terms of the 3-clause BSD license, which can be
+# found in the LICENSE file distributed with this file. Alternatively, you can
+# obtain a copy from the repository root cited above.
+#
+
+import re
+import sys
+
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from spyne import M, ComplexModel, UnsignedInteger, Unicode, Array, \
+    DateTime, Boolean
+
+from jmapd.model import UtcDate, JmapId, JmapMap, JmapSet, validate_id
+from jmapd.model._address import EmailAddress
+from jmapd.model._body import EmailBodyValue, EmailBodyPart, \
+    EmailBodyPartTable
+
+
+def _utcnow(_now=datetime.now, _utc=timezone.utc):
+    return _now(_utc)
+
+
+r"""
+Keywords are shared with IMAP. The six system keywords from IMAP get special
+treatment. The following four keywords have their first character changed
+from \ in IMAP to $ in JMAP and have particular semantic meaning:
+
+    $draft: The Email is a draft the user is composing.
+    $seen: The Email has been read.
+    $flagged: The Email has been flagged for urgent/special attention.
+    $answered: The Email has been replied to.
+
+The IMAP \Recent keyword is not exposed via JMAP. The IMAP \Deleted keyword
+is also not present: IMAP uses a delete+expunge model, which JMAP does not.
+Any message with the \Deleted keyword MUST NOT be visible via JMAP (and so
+are not counted in the “totalEmails”, “unreadEmails”, “totalThreads”,
+and “unreadThreads” Mailbox properties).
+
+Users may add arbitrary keywords to an Email. For compatibility with IMAP,
+a keyword is a case-insensitive string of 1–255 characters in the ASCII
+subset %x21–%x7e (excludes control chars and space), and it MUST NOT include
+any of these characters:
+
+  ( ) { ] % * " \
+
+Because JSON is case sensitive, servers MUST return keywords in lowercase.
+
+The IMAP and JMAP Keywords registry as established in [@!RFC5788] assigns
+semantic meaning to some other keywords in common use. New keywords may be
+established here in the future. In particular, note:
+
+    $forwarded: The Email has been forwarded.
+    $phishing: The Email is highly likely to be phishing. Clients SHOULD warn
+        users to take care when viewing this Email and disable links and
+        attachments.
+    $junk: The Email is definitely spam. Clients SHOULD set this flag when
+        users report spam to help train automated spam-detection systems.
+    $notjunk: The Email is definitely not spam. Clients SHOULD set this flag
+        when users indicate an Email is legitimate, to help train automated
+        spam-detection systems.
+
+"""
+
+# The keyword grammar above as a single negated character class, so that the
+# re engine checks it in one linear scan without backtracking.
+_KEYWORD_RE = re.compile(r'[^\x00-\x20\x7f-\U0010ffff(){\]%*"\\]{1,255}\Z')
+
+
+def validate_keyword(keyword):
+    """Returns True if ``keyword`` is a syntactically valid JMAP keyword."""
+
+    return _KEYWORD_RE.match(keyword) is not None
+
+
+# The same handful of keywords is repeated across every Email in a mailbox.
+# Handing out a single instance of each keeps them from being duplicated on
+# the heap and lets dict lookups succeed on the identity check.
+_KEYWORD_POOL = {k: sys.intern(k) for k in (
+    '$draft', '$seen', '$flagged', '$answered',
+    '$forwarded', '$phishing', '$junk', '$notjunk',
+)}
+
+
+def intern_keyword(keyword):
+    """Returns the shared, lowercase instance of ``keyword``."""
+
+    keyword = keyword.lower()
+    return _KEYWORD_POOL.get(keyword) or sys.intern(keyword)
+
+
+@lru_cache(maxsize=4096)
+def intern_mailbox_id(mailbox_id):
+    """Returns the first seen instance of ``mailbox_id`` while it's among the
+    most recently used mailbox ids."""
+
+    return mailbox_id
+
+
+def _intern_keywords(keywords):
+    # spyne calls parsers with None too, for a JSON null
+    if keywords is None:
+        return None
+    return {intern_keyword(k): v for k, v in keywords.items()}
+
+
+def _intern_mailbox_ids(mailbox_ids):
+    if mailbox_ids is None:
+        return None
+    return {intern_mailbox_id(k): v for k, v in mailbox_ids.items()}
+
+
+class Email(ComplexModel):
+    # see JmapJsonDocument._get_fast_serializer
+    _fast_dict = True
+
+    _type_info = [
+        #
+        # Metadata
+        #
+
+        ('id', JmapId(
+            sub_name='id',
+            doc="(immutable; server-set) The id of the Email object. Note "
+                "that this is the JMAP object id, NOT the Message-ID header "
+                "field value of the message [@!RFC5322]."
+        )),
+
+        ('blob_id', JmapId(
+            sub_name='blobId',
+            doc="(immutable; server-set) The id representing the raw "
+                "octets of the message [@!RFC5322] for this Email. This may "
+                "be used to download the raw original message or to attach it "
+                "directly to another Email, etc."
+        )),
+
+        ('thread_id', JmapId(
+            sub_name='threadId',
+            doc="(immutable; server-set) The id of the Thread to which "
+                "this Email belongs."
+        )),
+
+        ('mailbox_ids', JmapSet(
+            parser=_intern_mailbox_ids, key_validator=validate_id,
+            sub_name='mailboxIds',
+            doc="The set of Mailbox ids this Email belongs to. An "
+                "Email in the mail store MUST belong to one or more Mailboxes "
+                "at all times (until it is destroyed). The set is represented "
+                "as an object, with each key being a Mailbox id. The value "
+                "for each key in the object MUST be true."
+        )),
+
+        ('keywords', JmapSet(
+            parser=_intern_keywords, key_validator=validate_keyword,
+            sub_name='keywords',
+            doc="(default: {}) A set of keywords that apply "
+                "to the Email. The set is represented as an object, with the "
+                "keys being the keywords. The value for each key in the "
+                "object MUST be true."
+        )),
+
+        ('size', UnsignedInteger(
+            sub_name='size',
+            doc="(immutable; server-set) The size, in octets, "
+                "of the raw data for the message [@!RFC5322] (as referenced "
+                "by the blobId, i.e., the number of octets in the file the "
+                "user would download)."
+        )),
+
+        ('received_at', UtcDate(
+            default_factory=_utcnow,
+            sub_name='receivedAt',
+            doc="(immutable; default: time of creation on server) The "
+                "date the Email was received by the message store. This is "
+                "the internal date in IMAP [@?RFC3501]."
+        )),
+
+        #
+        # Header fields
+        #
+
+        ('message_id', Array(Unicode,
+            sub_name='messageId',
+            doc="(immutable) The value is identical to the "
+                "value of header:Message-ID:asMessageIds. For messages "
+                "conforming to RFC 5322 this will be an array with a single "
+                "entry."
+        )),
+
+        ('in_reply_to', Array(Unicode,
+            sub_name='inReplyTo',
+            doc="(immutable) The value is identical to the "
+                "value of header:In-Reply-To:asMessageIds."
+        )),
+
+        ('references', Array(Unicode,
+            sub_name='references',
+            doc="(immutable) The value is identical to the "
+                "value of header:References:asMessageIds."
+        )),
+
+        ('sender', Array(EmailAddress,
+            sub_name='sender',
+            doc="(immutable) The value is identical to "
+                "the value of header:Sender:asAddresses."
+        )),
+
+        ('from_', Array(Unicode,
+            sub_name='from',
+            doc="(immutable) The value is identical to "
+                "the value of header:From:asAddresses."
+        )),
+
+        ('to', Array(Unicode,
+            sub_name='to',
+            doc="(immutable) The value is identical to "
+                "the value of header:To:asAddresses."
+        )),
+
+        ('cc', Array(Unicode,
+            sub_name='cc',
+            doc="(immutable) The value is identical to "
+                "the value of header:Cc:asAddresses."
+        )),
+
+        ('bcc', Array(Unicode,
+            sub_name='bcc',
+            doc="(immutable) The value is identical to "
+                "the value of header:Bcc:asAddresses."
+        )),
+
+        ('reply_to', Unicode(
+            sub_name='replyTo',
+            doc="(immutable) The value is identical to "
+                "the value of header:Reply-To:asAddresses."
+        )),
+
+        ('subject', Unicode(
+            sub_name='subject',
+            doc="(immutable) The value is identical to the value "
+                "of header:Subject:asText."
+        )),
+
+        ('sent_at', DateTime(
+            sub_name='sentAt',
+            doc="(immutable; default on creation: current server "
+                "time) The value is identical to the value of "
+                "header:Date:asDate."
+        )),
+
+        #
+        # Body Parts
+        #
+
+        ('body_structure', Array(EmailBodyPart,
+            sub_name='bodyStructure',
+            doc="(immutable) This is the full MIME structure of the message "
+                "body, without recursing into message/rfc822 or message/global "
+                "parts. Note that EmailBodyParts may have subParts if they "
+                "are of type multipart."
+        )),
+
+        ('body_values', JmapMap(  # str: EmailBodyValue dict
+            value_type=EmailBodyValue, sub_name='bodyValues',
+            doc="(immutable) This is a map of partId to an EmailBodyValue "
+                "object for none, some, or all text parts. Which parts are "
+                "included and whether the value is truncated is determined "
+                "by various arguments to Email/get and Email/parse."
+        )),
+
+        ('text_body', Array(EmailBodyPart,
+            sub_name='textBody',
+            doc="(immutable) A list of text/plain, text/html, image, audio, "
+                "and/or video parts to display (sequentially) as the message "
+                "body, with a preference for text/plain when alternative "
+                "versions are available."
+        )),
+
+        ('html_body', Array(EmailBodyPart,
+            sub_name='htmlBody',
+            doc="(immutable) A list of text/plain, text/html, image, audio, "
+                "and/or video parts to display (sequentially) as the message "
+                "body, with a preference for text/html when alternative "
+                "versions are available."
+        )),
+
+        ('attachments', Array(EmailBodyPart,
+            sub_name='attachments',
+            doc="(immutable) A list, traversing depth-first, "
+                "of all parts in bodyStructure that satisfy either of the "
+                "following conditions:"
+        )),
+
+        ('has_attachment', M(Boolean(
+            sub_name='hasAttachment', default=False,
+            doc="(immutable; server-set) This is true if there are "
+                "one or more parts in the message that a client UI should "
+                "offer as downloadable. A server SHOULD set hasAttachment to "
+                "true if the attachments list contains at least one item that "
+                "does not have Content-Disposition: inline. The server MAY "
+                "ignore parts in this list that are processed automatically "
+                "in some way or are referenced as embedded images in one of "
+                "the text/html parts of the message."
+        ))),
+
+        # the length limit is enforced by make_preview() when the value is
+        # set instead of being validated on every (de)serialization.
+        ('preview', Unicode(
+            sub_name='preview', default=u'',
+            doc="(immutable; server-set) A plaintext fragment of the "
+                "message body. This is intended to be shown as a preview line "
+                "when listing messages in the mail store and may be truncated "
+                "when shown. The server may choose which part of the message "
+                "to include in the preview; skipping quoted sections and "
+                "salutations and collapsing white space can result in a more "
+                "useful preview."
+        )),
+    ]
+
+    @staticmethod
+    def make_preview(text):
+        """Returns ``text`` cut to the 256 characters allowed for
+        ``preview``."""
+
+        return text[:256]
+
+    def derive_body_parts(self):
+        """Sets ``text_body``, ``html_body``, ``attachments`` and
+        ``has_attachment`` from ``body_structure``. This is meant to be called
+        once, when the Email is ingested."""
+
+        table = EmailBodyPartTable.from_tree(self.body_structure or ())
+        text_body, html_body, attachments = table.get_derived_rows()
+
+        parts = table.parts
+        self.text_body = [parts[i] for i in text_body]
+        self.html_body = [parts[i] for i in html_body]
+        self.attachments = [parts[i] for i in attachments]
+        self.has_attachment = any(parts[i].disposition != 'inline'
+                                                          for i in attachments)
@@ -13,44 +13,45 @@ from __future__ import unicode_literals
 
 from spyne import M, ComplexModel, Unicode, UnsignedInteger, Array, Boolean
 from spyne.protocol.dictdoc import DictDocument
+from spyne.util import memoize
 
 
 class CoreCapabilities(ComplexModel):
     _type_info = [
         ('max_size_upload', UnsignedInteger(
-            subname='maxSizeUpload',
+            sub_name='maxSizeUpload',
             doc="The maximum file size, in octets, that the server will "
                 "accept for a single file upload (for any purpose). Suggested "
                 "minimum: 50,000,000."
         )),
         ('max_concurrent_upload', UnsignedInteger(
-            subname='maxConcurrentUpload',
+            sub_name='maxConcurrentUpload',
             doc="The maximum number of concurrent requests the server will "
                 "accept to the upload endpoint. Suggested minimum: 4."
         )),
         ('max_size_request', UnsignedInteger(
-            subname='maxSizeRequest',
+            sub_name='maxSizeRequest',
             doc="The maximum size, in octets, that the server will accept for "
                 "a single request to the API endpoint. Suggested minimum: 10,"
                 "000,000."
         )),
         ('max_concurrent_requests', UnsignedInteger(
-            subname='maxConcurrentRequests',
+            sub_name='maxConcurrentRequests',
             doc="The maximum number of concurrent requests the server will "
                 "accept to the API endpoint. Suggested minimum: 4."
         )),
         ('max_calls_in_request', UnsignedInteger(
-            subname='maxCallsInRequest',
+            sub_name='maxCallsInRequest',
             doc="The maximum number of method calls the server will accept in "
                 "a single request to the API endpoint. Suggested minimum: 16."
         )),
         ('max_objects_in_get', UnsignedInteger(
-            subname='maxObjectsInGet',
+            sub_name='maxObjectsInGet',
             doc="The maximum number of objects that the client may request in "
                 "a single /get type method call. Suggested minimum: 500."
         )),
         ('max_objects_in_set', UnsignedInteger(
-            subname='maxObjectsInSet',
+            sub_name='maxObjectsInSet',
             doc="The maximum number of objects the client may send to create, "
                 "update, or destroy in a single /set type method call. This "
                 "is the combined total, e.g., if the maximum is 10, you could "
@@ -58,7 +59,7 @@ class CoreCapabilities(ComplexModel):
                 "actions, which exceeds the limit. Suggested minimum: 500."
         )),
         ('collation_algorithms', Array(Unicode,
-            subname='collationAlgorithms',
+            sub_name='collationAlgorithms',
             doc="A list of identifiers for algorithms registered in the "
                 "collation registry, as defined in [@!RFC4790], that the "
                 "server supports for sorting when querying records."
@@ -140,6 +141,19 @@ class MailCapabilities(ComplexModel):
     ]
 
 
+@memoize
+def _customize_for_dictdoc(cls, sub_name):
+    # standard sub_name value is invalid XML so it's restricted to dict-based
+    # protocols.
+    return cls.customize(pa={DictDocument: dict(sub_name=sub_name)})
+
+
+_CoreCapabilitiesJmap = _customize_for_dictdoc(CoreCapabilities,
+                                                   'urn:ietf:params:jmap:core')
+_MailCapabilitiesJmap = _customize_for_dictdoc(MailCapabilities,
+                                                   'urn:ietf:params:jmap:mail')
+
+
 class Capabilities(ComplexModel):
     """
     An object specifying the capabilities of this server. Each key is a URI for
@@ -151,14 +165,6 @@ class Capabilities(ComplexModel):
     """
 
     _type_info = [
-        ('core', CoreCapabilities.customize(
-            # standard sub_name value is invalid XML so it's restricted to
-            # dict-based protocols.
-            pa={DictDocument: dict(sub_name='urn:ietf:params:jmap:core')}
-        )),
-        ('mail', MailCapabilities.customize(
-            # standard sub_name value is invalid XML so it's restricted to
-            # dict-based protocols.
-            pa={DictDocument: dict(sub_name='urn:ietf:params:jmap:mail')}
-        )),
+        ('core', _CoreCapabilitiesJmap),
+        ('mail', _MailCapabilitiesJmap),
     ]
@@ -20,7 +20,7 @@ class LogEntry(ComplexModel):
     _type_info = [
         ('id', M(Integer64(pk=True))),
         ('time', M(DateTime(
-            timezone=False, default_factory=lambda: datetime.utcnow(),
+            timezone=False, default_factory=datetime.utcnow,
         ))),
         ('host', IpAddress),
         ('data', Any),
@@ -0,0 +1,443 @@
+
+#
+# This file is part of the jmapd project at https://github.com/arskom/jmapd.
+#
+# jmapd (c) 2020 and beyond, Arskom Ltd. All rights reserved.
+#
+# This file is subject to the terms of the 3-clause BSD license, which can be
+# found in the LICENSE file distributed with this file. Alternatively, you can
+# obtain a copy from the repository root cited above.
+#
+
+import logging
+logger = logging.getLogger(__name__)
+
+from datetime import timezone
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from spyne import ComplexModelBase, Boolean, Integer, Unicode, Array, \
+    DateTime
+from spyne.error import ValidationError
+from spyne.protocol.json import JsonDocument, JsonEncoder
+from spyne.util import memoize
+
+from jmapd.model import JmapMap, JmapSet
+
+
+if orjson is not None:
+    # naive datetimes that reach orjson are UTCDate values, see
+    # _is_utc_date()
+    _ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NAIVE_UTC \
+                                                     | orjson.OPT_NON_STR_KEYS
+
+
+def _orjson_default(o):
+    # same fallback as spyne's JsonEncoder: it's possibly a generator.
+    return list(o)
+
+
+# Types whose native values JsonDocument already emits as they are.
+_JSON_NATIVE = (Boolean, Integer)
+
+# Elements of a string array that can be emitted without the protocol. Other
+# values, e.g. bytes, still need decoding by to_unicode.
+_NATIVE_STRING_TYPES = frozenset((str, type(None)))
+
+
+def _is_native_value(cls):
+    """Returns True when DictDocument would emit native values of ``cls``
+    unchanged, regardless of how many times ``cls`` may occur."""
+
+    attrs = cls.Attributes
+    if attrs.sanitizer is not None or attrs.out_type is not None:
+        return False
+
+    if issubclass(cls, Unicode):
+        return attrs.format is None
+
+    return issubclass(cls, _JSON_NATIVE)
+
+
+def _is_passthrough(cls):
+    """Returns True when DictDocument would emit native values of ``cls``
+    unchanged, so generated code can skip calling into the protocol."""
+
+    return cls.Attributes.max_occurs <= 1 and _is_native_value(cls)
+
+
+@memoize
+def _is_string_array(cls):
+    """Returns True for ``Array(Unicode)`` types whose elements can be emitted
+    as they are. Such arrays are copied with a single ``list()`` call instead
+    of going through the protocol once per element."""
+
+    if not issubclass(cls, Array) or cls.Attributes.sanitizer is not None:
+        return False
+
+    # the child of an Array has max_occurs > 1, so _is_passthrough() would
+    # always reject it.
+    child, = cls._type_info.values()
+    return issubclass(child, Unicode) and _is_native_value(child)
+
+
+@memoize
+def _is_utc_date(cls):
+    """Returns True for ``DateTime`` types with ``timezone=False`` and no
+    custom output format, which is how :data:`jmapd.model.UtcDate` is
+    defined. Their values are emitted in UTC with the ``Z`` suffix that JMAP
+    requires for the UTCDate type."""
+
+    if not issubclass(cls, DateTime):
+        return False
+
+    attrs = cls.Attributes
+    if attrs.timezone or attrs.as_timezone is not None \
+                          or attrs.dt_format is not None \
+                          or attrs.out_format is not None \
+                          or attrs.string_format is not None \
+                          or attrs.serialize_as is not None \
+                          or attrs.sanitizer is not None \
+                          or attrs.out_type is not None:
+        return False
+
+    return True
+
+
+def _to_utc(value):
+    if value.tzinfo is not None and value.utcoffset():
+        return value.astimezone(timezone.utc)
+    return value
+
+
+def _has_prot_attrs(cls):
+    for v in cls.get_flat_type_info(cls).values():
+        if v.Attributes.prot_attrs:
+            return True
+    return False
+
+
+def build_fast_dict_serializer(cls):
+    """Compiles a function that renders instances of ``cls`` to a dict the way
+    ``HierDictDocument._get_member_pairs`` does, but with the loop over
+    ``_type_info`` unrolled into straight-line attribute access. Fields that
+    need the protocol (dates, arrays, nested models) are still passed to
+    ``_object_to_doc``, which picks up the nested model's own fast serializer
+    when it has one.
+
+    Per-protocol attributes (``pa=``) of the fields are not taken into
+    account, so JmapJsonDocument doesn't use this for classes that have any.
+    """
+
+    lines = [
+        "def _fast_to_dict(prot, o, tags):",
+        "    tags = tags | {id(o)}",
+        "    to_doc = prot._object_to_doc",
+        "    d = {}",
+    ]
+    ns = {}
+
+    for i, (k, v) in enumerate(cls.get_flat_type_info(cls).items()):
+        attrs = v.Attributes
+        if attrs.exc:
+            continue
+
+        key = attrs.sub_name
+        if key is None:
+            key = k
+
+        ns['T%d' % i] = v
+        lines.append("    v = o.%s" % k)
+
+        if attrs.default is not None:
+            ns['D%d' % i] = attrs.default
+            lines.append("    if v is None:")
+            lines.append("        v = D%d" % i)
+
+        mandatory = attrs.min_occurs > 0 \
+                        or getattr(attrs, 'complex_as', None) is list
+        if mandatory:
+            emit = "d[%r] = v" % key
+        else:
+            emit = "if v is not None: d[%r] = v" % key
+
+        if _is_passthrough(v):
+            if issubclass(v, Unicode):
+                # anything other than str needs decoding by the protocol
+                lines.append("    if v.__class__ is not str and v is not None:")
+                lines.append("        v = to_doc(T%d, v, tags)" % i)
+            lines.append("    " + emit)
+
+        elif _is_string_array(v):
+            ns['_is_native'] = _NATIVE_STRING_TYPES.issuperset
+            lines.append("    if v is not None:")
+            lines.append("        v = list(v)")
+            # same as for Unicode above: only str is emitted as it is
+            lines.append("        if not _is_native(map(type, v)):")
+            lines.append("            v = to_doc(T%d, v, tags)" % i)
+            lines.append("    " + emit)
+
+        else:
+            lines.append("    if v is None:")
+            if mandatory:
+                lines.append("        d[%r] = None" % key)
+            else:
+                lines.append("        pass")
+            lines.append("    elif id(v) not in tags:")
+            lines.append("        v = to_doc(T%d, v, tags)" % i)
+            lines.append("        " + emit)
+
+    lines.append("    return d")
+
+    source = '\n'.join(lines)
+    exec(compile(source, '<fast_to_dict %s>' % cls.get_type_name(), 'exec'),
+                                                                            ns)
+    return ns['_fast_to_dict']
+
+
+class JmapJsonDocument(JsonDocument):
+    """JsonDocument that also knows how to handle jmapd-specific types. When
+    orjson is installed, it's used for encoding outgoing documents unless
+    extra arguments for ``json.dumps`` were passed to the constructor."""
+
+    def __init__(self, *args, **kwargs):
+        super(JmapJsonDocument, self).__init__(*args, **kwargs)
+
+        self._fastcache = {}
+        self._plancache = {}
+        self._defaultcache = {}
+
+        kwargs = self.kwargs
+        self._use_orjson = orjson is not None \
+                    and not (set(kwargs) - {'cls'}) \
+                    and kwargs.get('cls', JsonEncoder) is JsonEncoder
+
+    def create_out_string(self, ctx, out_string_encoding='utf8'):
+        if not self._use_orjson:
+            return super(JmapJsonDocument, self).create_out_string(ctx,
+                                                            out_string_encoding)
+
+        dumps = orjson.dumps
+        out_strings = (dumps(o, default=_orjson_default, option=_ORJSON_OPTIONS)
+                                                      for o in ctx.out_document)
+
+        # orjson always emits utf8
+        if out_string_encoding is None:
+            ctx.out_string = (s.decode('utf8') for s in out_strings)
+        elif out_string_encoding.replace('-', '').lower() == 'utf8':
+            ctx.out_string = out_strings
+        else:
+            ctx.out_string = (s.decode('utf8').encode(out_string_encoding)
+                                                          for s in out_strings)
+
+    def _to_dict_value(self, cls, inst, tags, cls_orig=None):
+        if issubclass(cls, JmapMap):
+            return self._map_to_dict(cls, inst, tags)
+
+        if issubclass(cls, JmapSet):
+            return dict.fromkeys(inst, True)
+
+        if _is_utc_date(cls):
+            return self._utc_date_to_dict(inst)
+
+        return super(JmapJsonDocument, self)._to_dict_value(cls, inst, tags,
+                                                             cls_orig=cls_orig)
+
+    def _from_dict_value(self, ctx, key, cls, inst, validator):
+        if issubclass(cls, JmapMap) and inst is not None:
+            return self._map_from_dict(ctx, key, cls, inst, validator)
+
+        if issubclass(cls, JmapSet) and inst is not None:
+            return self._set_from_dict(ctx, key, cls, inst, validator)
+
+        return super(JmapJsonDocument, self)._from_dict_value(ctx, key, cls,
+                                                            inst, validator)
+
+    def _complex_to_dict(self, cls, inst, tags):
+        fast = self._get_fast_serializer(cls)
+        if fast is None:
+            return super(JmapJsonDocument, self)._complex_to_dict(cls, inst,
+                                                                          tags)
+
+        return fast(self, cls.get_serialization_instance(inst), tags)
+
+    def _get_fast_serializer(self, cls):
+        if cls in self._fastcache:
+            return self._fastcache[cls]
+
+        # Classes opt in by setting _fast_dict = True in their own body, which
+        # customized classes get from the class they come from. Those still
+        # get their own serializer, as e.g. child_attrs can change sub_names
+        # or exclude fields.
+        orig = cls.__orig__ or cls
+        fast = None
+        if orig.__dict__.get('_fast_dict', False):
+            cls_attrs = self.get_cls_attrs(cls)
+            if self.key_encoding is None and not cls_attrs.wrapper \
+                    and (self.ignore_wrappers or cls_attrs.not_wrapped) \
+                    and self.get_complex_as(cls_attrs) is dict \
+                    and not _has_prot_attrs(cls):
+                fast = build_fast_dict_serializer(cls)
+
+        self._fastcache[cls] = fast
+        return fast
+
+    def _get_member_plan(self, cls):
+        """Returns a tuple of ``(attr, type, key, default, mandatory,
+        string_array)`` for every serializable field of ``cls``. Everything
+        in it is static per class and protocol, so it's computed once instead
+        of on every call to :meth:`_get_member_pairs`."""
+
+        if cls in self._plancache:
+            return self._plancache[cls]
+
+        plan = []
+        for k, v in self.sort_fields(cls):
+            attrs = self.get_cls_attrs(v)
+            if attrs.exc:
+                continue
+
+            sub_name = attrs.sub_name
+            if sub_name is None:
+                sub_name = k
+
+            mandatory = attrs.min_occurs > 0 \
+                                       or self.get_complex_as(attrs) is list
+            plan.append((k, v, sub_name, attrs.default, mandatory,
+                                                         _is_string_array(v)))
+
+        plan = self._plancache[cls] = tuple(plan)
+        return plan
+
+    def _get_member_pairs(self, cls, inst, tags):
+        tags = tags | {id(inst)}
+        to_doc = self._object_to_doc
+
+        for k, v, sub_name, default, mandatory, string_array \
+                                              in self._get_member_plan(cls):
+            try:
+                subinst = getattr(inst, k, None)
+
+            # to guard against e.g. sqlalchemy throwing NoSuchColumnError
+            except Exception as e:
+                logger.error("Error getting %r: %r", k, e)
+                subinst = None
+
+            if subinst is None:
+                subinst = default
+            elif id(subinst) in tags:
+                continue
+
+            # This is done here and not in _to_dict_value because with
+            # ignore_wrappers, _object_to_doc unwraps the array and calls
+            # _to_dict_value once per element.
+            if string_array and subinst is not None:
+                val = list(subinst)
+                if not _NATIVE_STRING_TYPES.issuperset(map(type, val)):
+                    val = to_doc(v, val, tags)
+            else:
+                val = to_doc(v, subinst, tags)
+
+            if val is not None or mandatory:
+                yield sub_name, val
+
+    def _utc_date_to_dict(self, inst):
+        inst = _to_utc(inst)
+
+        # orjson formats datetimes itself, see _ORJSON_OPTIONS
+        if self._use_orjson:
+            return inst
+
+        return inst.replace(tzinfo=None).isoformat() + 'Z'
+
+    def _map_to_dict(self, cls, inst, tags):
+        value_type = self.get_cls_attrs(cls).value_type
+        if value_type is None or issubclass(value_type, _JSON_NATIVE):
+            return inst
+
+        to_doc = self._object_to_doc
+        return {k: to_doc(value_type, v, tags) for k, v in inst.items()}
+
+    def _map_from_dict(self, ctx, key, cls, inst, validator):
+        if not isinstance(inst, dict):
+            raise ValidationError([key, inst])
+
+        cls_attrs = self.get_cls_attrs(cls)
+        inst = self._parse(cls_attrs, inst)
+
+        value_type = cls_attrs.value_type
+        if value_type is None:
+            return inst
+
+        if issubclass(value_type, ComplexModelBase):
+            to_obj = self._doc_to_object
+            fill = self._fill_member_defaults
+
+            retval = {}
+            for k, v in inst.items():
+                if not isinstance(v, dict):
+                    raise ValidationError([k, v])
+                retval[k] = to_obj(ctx, value_type, fill(value_type, v),
+                                                                     validator)
+            return retval
+
+        if validator is not self.SOFT_VALIDATION:
+            return inst
+
+        from_dict = self._from_dict_value
+        return {k: from_dict(ctx, k, value_type, v, validator)
+                                                      for k, v in inst.items()}
+
+    def _get_member_defaults(self, cls):
+        """Returns a tuple of ``(key, default)`` for the mandatory fields of
+        ``cls`` that have a default value."""
+
+        if cls in self._defaultcache:
+            return self._defaultcache[cls]
+
+        defaults = []
+        for k, v in cls.get_flat_type_info(cls).items():
+            attrs = self.get_cls_attrs(v)
+            if attrs.min_occurs > 0 and attrs.default is not None:
+                key = attrs.sub_name
+                if key is None:
+                    key = k
+                defaults.append((key, attrs.default))
+
+        defaults = self._defaultcache[cls] = tuple(defaults)
+        return defaults
+
+    def _fill_member_defaults(self, cls, doc):
+        """Adds the defaults of mandatory fields that are missing from
+        ``doc``. JMAP lets clients omit properties that have their default
+        value, e.g. ``isTruncated`` in an EmailBodyValue."""
+
+        retval = None
+        for key, default in self._get_member_defaults(cls):
+            if key not in doc:
+                if retval is None:
+                    retval = dict(doc)
+                retval[key] = default
+
+        if retval is None:
+            return doc
+        return retval
+
+    def _set_from_dict(self, ctx, key, cls, inst, validator):
+        if not isinstance(inst, dict):
+            raise ValidationError([key, inst])
+
+        cls_attrs = self.get_cls_attrs(cls)
+
+        if validator is self.SOFT_VALIDATION:
+            key_validator = cls_attrs.key_validator
+            for k, v in inst.items():
+                if v is not True:
+                    raise ValidationError([k, v])
+                if key_validator is not None and not key_validator(k):
+                    raise ValidationError(k)
+
+        return frozenset(self._parse(cls_attrs, inst))
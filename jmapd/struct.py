@@ -0,0 +1,141 @@
+
+#
+# This file is part of the jmapd project at https://github.com/arskom/jmapd.
+#
+# jmapd (c) 2020 and beyond, Arskom Ltd. All rights reserved.
+#
+# This file is subject to the terms of the 3-clause BSD license, which can be
+# found in the LICENSE file distributed with this file. Alternatively, you can
+# obtain a copy from the repository root cited above.
+#
+
+"""Mirrors of the spyne models as ``msgspec.Struct`` types. msgspec encodes
+these to JSON bytes in a single pass, without building the intermediate dict
+that DictDocument produces.
+
+msgspec is an optional dependency. When it's not installed, ``msgspec`` in
+this module is ``None`` and the functions here raise ``ImportError``.
+"""
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+from datetime import timezone
+
+from spyne import ComplexModelBase, Array
+from spyne.util import memoize
+
+from jmapd.model import JmapMap, JmapSet
+from jmapd.protocol import JmapJsonDocument, _is_utc_date
+
+
+_PLAIN, _MODEL, _MODEL_LIST, _MODEL_MAP, _SET, _UTC_DATE = range(6)
+
+# Only used for resolving the per-protocol attributes (``pa=``) of the fields
+# the way JmapJsonDocument sees them, e.g. the sub_names of Capabilities.
+_protocol = JmapJsonDocument()
+
+
+def _is_model(cls):
+    return issubclass(cls, ComplexModelBase) and not issubclass(cls, Array)
+
+
+def _get_kind(cls):
+    if issubclass(cls, Array):
+        child, = cls._type_info.values()
+        return _MODEL_LIST if _is_model(child) else _PLAIN
+
+    if issubclass(cls, JmapMap):
+        value_type = cls.Attributes.value_type
+        if value_type is not None and _is_model(value_type):
+            return _MODEL_MAP
+        return _PLAIN
+
+    if issubclass(cls, JmapSet):
+        return _SET
+
+    if _is_utc_date(cls):
+        return _UTC_DATE
+
+    if _is_model(cls):
+        if cls.Attributes.max_occurs > 1:
+            return _MODEL_LIST
+        return _MODEL
+
+    return _PLAIN
+
+
+@memoize
+def get_struct(cls):
+    """Returns a frozen ``msgspec.Struct`` type with the fields of the spyne
+    model ``cls`` and a conversion plan for :func:`to_msgspec`. Fields are
+    renamed to their ``sub_name`` and ``None`` values are left out of the
+    output."""
+
+    if msgspec is None:
+        raise ImportError("msgspec is required for this")
+
+    fields = []
+    rename = {}
+    plan = []
+    for k, v in cls.get_flat_type_info(cls).items():
+        attrs = _protocol.get_cls_attrs(v)
+        if attrs.exc:
+            continue
+
+        fields.append((k, object, None))
+        if attrs.sub_name is not None:
+            rename[k] = attrs.sub_name
+
+        plan.append((k, _get_kind(v)))
+
+    struct = msgspec.defstruct(cls.get_type_name(), fields, rename=rename,
+                       omit_defaults=True, frozen=True, module=cls.__module__)
+
+    return struct, tuple(plan)
+
+
+def to_msgspec(inst):
+    """Converts an instance of a spyne model to an instance of its struct
+    type from :func:`get_struct`."""
+
+    struct, plan = get_struct(inst.__class__)
+
+    kwargs = {}
+    for k, kind in plan:
+        v = getattr(inst, k, None)
+        if v is None:
+            continue
+
+        if kind is _MODEL:
+            v = to_msgspec(v)
+        elif kind is _MODEL_LIST:
+            v = [to_msgspec(sub) for sub in v]
+        elif kind is _MODEL_MAP:
+            v = {key: to_msgspec(sub) for key, sub in v.items()}
+        elif kind is _SET:
+            v = dict.fromkeys(v, True)
+        elif kind is _UTC_DATE:
+            # msgspec emits the Z only for aware datetimes in UTC
+            if v.tzinfo is None:
+                v = v.replace(tzinfo=timezone.utc)
+            elif v.utcoffset():
+                v = v.astimezone(timezone.utc)
+
+        kwargs[k] = v
+
+    return struct(**kwargs)
+
+
+_encoder = None if msgspec is None else msgspec.json.Encoder()
+
+
+def encode_json(inst):
+    """Encodes an instance of a spyne model to JSON bytes using msgspec."""
+
+    if _encoder is None:
+        raise ImportError("msgspec is required for this")
+
+    return _encoder.encode(to_msgspec(inst))
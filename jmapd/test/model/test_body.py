@@ -0,0 +1,380 @@
+#!/usr/bin/env python
+# encoding: utf8
+#
+# This file is part of the jmapd project at https://github.com/arskom/jmapd.
+#
+# jmapd (c) 2020 and beyond, Arskom Ltd. All rights reserved.
+#
+# This file is subject to the terms of the 3-clause BSD license, which can be
+# found in the LICENSE file distributed with this file. Alternatively, you can
+# obtain a copy from the repository root cited above.
+#
+
+import random
+import unittest
+
+from jmapd.model.mail import Email, EmailBodyPart, EmailBodyPartTable
+
+
+def _is_inline_media(type_):
+    return type_.startswith(('image/', 'audio/', 'video/'))
+
+
+def parse_structure(parts, multipart_type, in_alternative,
+                                              html_body, text_body, attachments):
+    """A direct port of the reference algorithm in RFC 8621 section 4.1.4.
+    The only change is that parts in an alternative are skipped when the
+    list they'd go to is already None, where the reference would fail."""
+
+    text_length = -1 if text_body is None else len(text_body)
+    html_length = -1 if html_body is None else len(html_body)
+
+    for i, part in enumerate(parts):
+        type_ = part.type or ''
+        is_multipart = type_.startswith('multipart/')
+        # Is this an inline part?
+        is_inline = part.disposition != 'attachment' and \
+            (type_ in ('text/plain', 'text/html')
+                                              or _is_inline_media(type_)) and \
+            (i == 0 or (multipart_type != 'related'
+                                and (_is_inline_media(type_) or not part.name)))
+
+        if is_multipart:
+            sub_multipart_type = type_.split('/')[1]
+            parse_structure(part.subParts, sub_multipart_type,
+                in_alternative or sub_multipart_type == 'alternative',
+                                          html_body, text_body, attachments)
+
+        elif is_inline:
+            if multipart_type == 'alternative':
+                if type_ == 'text/plain':
+                    if text_body is not None:
+                        text_body.append(part)
+                elif type_ == 'text/html':
+                    if html_body is not None:
+                        html_body.append(part)
+                else:
+                    attachments.append(part)
+                continue
+
+            elif in_alternative:
+                if type_ == 'text/plain':
+                    html_body = None
+                if type_ == 'text/html':
+                    text_body = None
+
+            if text_body is not None:
+                text_body.append(part)
+            if html_body is not None:
+                html_body.append(part)
+            if (text_body is None or html_body is None) \
+                                                   and _is_inline_media(type_):
+                attachments.append(part)
+
+        else:
+            attachments.append(part)
+
+    if multipart_type == 'alternative' and text_body is not None \
+                                                      and html_body is not None:
+        # Found HTML part only
+        if text_length == len(text_body) and html_length != len(html_body):
+            text_body.extend(html_body[html_length:])
+
+        # Found plaintext part only
+        if html_length == len(html_body) and text_length != len(text_body):
+            html_body.extend(text_body[text_length:])
+
+
+def _leaf(part_id, type_, disposition=None, name=None):
+    return EmailBodyPart(part_id=part_id, type=type_,
+                                             disposition=disposition, name=name)
+
+
+def _multipart(subtype, *sub_parts):
+    return EmailBodyPart(type='multipart/' + subtype, subParts=list(sub_parts))
+
+
+_LEAF_TYPES = ('text/plain', 'text/html', 'image/png', 'application/pdf',
+                                                                   'video/mp4')
+_MULTIPART_SUBTYPES = ('mixed', 'alternative', 'related')
+
+
+def _random_part(rng, depth):
+    if depth < 3 and rng.random() < 0.4:
+        return _multipart(rng.choice(_MULTIPART_SUBTYPES),
+                *(_random_part(rng, depth + 1)
+                                          for _ in range(rng.randint(0, 4))))
+
+    part = _leaf(None, rng.choice(_LEAF_TYPES),
+                          disposition=rng.choice((None, 'inline', 'attachment')),
+                          name=rng.choice((None, 'file')))
+
+    # parts that aren't multipart/ can have subParts too, e.g. message/rfc822
+    if depth < 3 and rng.random() < 0.1:
+        part.subParts = [_random_part(rng, depth + 1)
+                                          for _ in range(rng.randint(1, 2))]
+
+    return part
+
+
+class TestDerivedRows(unittest.TestCase):
+    def derive(self, *roots):
+        table = EmailBodyPartTable.from_tree(roots)
+        parts = table.parts
+        return [[parts[i] for i in rows] for rows in table.get_derived_rows()]
+
+    def reference(self, *roots):
+        text_body, html_body, attachments = [], [], []
+        parse_structure(roots, 'mixed', False,
+                                            html_body, text_body, attachments)
+        return [text_body, html_body, attachments]
+
+    def assert_derived(self, roots, text_body, html_body, attachments):
+        got = [[part.part_id for part in rows] for rows in self.derive(*roots)]
+        self.assertEqual(got, [text_body, html_body, attachments])
+
+        expected = [[part.part_id for part in rows]
+                                             for rows in self.reference(*roots)]
+        self.assertEqual(expected, [text_body, html_body, attachments])
+
+    def test_alternative(self):
+        self.assert_derived([
+            _multipart('alternative',
+                _leaf('1', 'text/plain'),
+                _leaf('2', 'text/html'),
+            ),
+        ], ['1'], ['2'], [])
+
+    def test_alternative_text_only(self):
+        self.assert_derived([
+            _multipart('alternative',
+                _leaf('1', 'text/plain'),
+            ),
+        ], ['1'], ['1'], [])
+
+    def test_related_in_alternative(self):
+        self.assert_derived([
+            _multipart('mixed',
+                _multipart('alternative',
+                    _leaf('1', 'text/plain'),
+                    _multipart('related',
+                        _leaf('2', 'text/html'),
+                        _leaf('3', 'image/png'),
+                    ),
+                ),
+                _leaf('4', 'application/pdf', disposition='attachment'),
+            ),
+        ], ['1'], ['2'], ['3', '4'])
+
+    def test_nested_alternative(self):
+        self.assert_derived([
+            _multipart('alternative',
+                _multipart('alternative',
+                    _leaf('1', 'text/plain'),
+                ),
+                _leaf('2', 'text/html'),
+            ),
+        ], ['1'], ['1', '2'], [])
+
+    def test_media_in_alternative_branch(self):
+        # the mixed branch only has text, so the image goes to textBody and
+        # also to attachments.
+        self.assert_derived([
+            _multipart('alternative',
+                _multipart('mixed',
+                    _leaf('1', 'text/plain'),
+                    _leaf('2', 'image/png'),
+                ),
+                _leaf('3', 'text/html'),
+            ),
+        ], ['1', '2'], ['3'], ['2'])
+
+    def test_alternative_under_text_only_branch(self):
+        # after the first text/plain, the html list of the mixed branch is
+        # None. The nested alternative must skip its html part instead of
+        # appending to it.
+        self.assert_derived([
+            _multipart('alternative',
+                _multipart('mixed',
+                    _leaf('1', 'text/plain'),
+                    _multipart('alternative',
+                        _leaf('2', 'text/plain'),
+                        _leaf('3', 'text/html'),
+                    ),
+                ),
+                _leaf('4', 'text/html'),
+            ),
+        ], ['1', '2'], ['4'], [])
+
+    def test_subparts_of_non_multipart(self):
+        # the reference algorithm doesn't look at the children of parts that
+        # aren't multipart/
+        attached = EmailBodyPart(part_id='2', type='message/rfc822',
+            subParts=[
+                _leaf('3', 'text/plain'),
+                _multipart('alternative',
+                    _leaf('4', 'text/plain'),
+                    _leaf('5', 'text/html'),
+                ),
+            ])
+
+        self.assert_derived([
+            _multipart('mixed',
+                _leaf('1', 'text/plain'),
+                attached,
+                _leaf('6', 'text/plain', disposition='inline'),
+            ),
+        ], ['1', '6'], ['1', '6'], ['2'])
+
+    def test_multipart_is_case_sensitive(self):
+        upper = EmailBodyPart(part_id='1', type='MULTIPART/mixed',
+                                          subParts=[_leaf('2', 'text/plain')])
+        self.assert_derived([upper], [], [], ['1'])
+
+    def test_random_trees(self):
+        rng = random.Random(1)
+        for n in range(2000):
+            roots = [_random_part(rng, 0) for _ in range(rng.randint(1, 2))]
+
+            got = self.derive(*roots)
+            expected = self.reference(*roots)
+            for got_rows, expected_rows in zip(got, expected):
+                self.assertEqual([id(p) for p in got_rows],
+                                   [id(p) for p in expected_rows], "tree %d" % n)
+
+
+def _get_tree():
+    return [
+        _multipart('mixed',
+            _multipart('alternative',
+                _leaf('1', 'text/plain'),
+                _leaf('2', 'text/html'),
+            ),
+            EmailBodyPart(part_id='3', type='message/rfc822',
+                                        subParts=[_leaf('4', 'text/plain')]),
+            _leaf('5', 'application/pdf', disposition='attachment'),
+        ),
+        _leaf('6', 'text/plain'),
+    ]
+
+
+def _shape(parts):
+    return [(id(p), _shape(p.subParts or ())) for p in parts]
+
+
+class TestEmailBodyPartTable(unittest.TestCase):
+    def test_from_tree(self):
+        table = EmailBodyPartTable.from_tree(_get_tree())
+
+        self.assertEqual([p.part_id for p in table.parts],
+                               [None, None, '1', '2', '3', '4', '5', '6'])
+        self.assertEqual(list(table.parent_idx), [-1, 0, 1, 1, 0, 4, 0, -1])
+        self.assertEqual(table.types, [p.type for p in table.parts])
+        self.assertEqual(table.dispositions,
+                                         [p.disposition for p in table.parts])
+        self.assertEqual(table.names, [p.name for p in table.parts])
+
+    def test_round_trip(self):
+        roots = _get_tree()
+        shape = _shape(roots)
+        subparts = [p.subParts for root in roots for p in root.walk_body()]
+
+        table = EmailBodyPartTable.from_tree(roots)
+        for part in table.parts:
+            part.subParts = None
+
+        self.assertEqual(_shape(table.as_tree()), shape)
+
+        # leaves that had no subParts don't get an empty list
+        for part, sub in zip(table.parts, subparts):
+            if sub is None:
+                self.assertIsNone(part.subParts)
+
+    def test_empty(self):
+        table = EmailBodyPartTable.from_tree([])
+        self.assertEqual(table.parts, [])
+        self.assertEqual(table.as_tree(), [])
+
+
+class TestWalkBody(unittest.TestCase):
+    def test_order(self):
+        roots = _get_tree()
+
+        walked = [p for root in roots for p in root.walk_body()]
+        table = EmailBodyPartTable.from_tree(roots)
+        self.assertEqual([id(p) for p in walked], [id(p) for p in table.parts])
+
+        self.assertEqual([p.part_id for p in roots[0].walk_body()],
+                                  [None, None, '1', '2', '3', '4', '5'])
+
+    def test_leaf(self):
+        part = _leaf('1', 'text/plain')
+        self.assertEqual(list(part.walk_body()), [part])
+
+    def test_deep(self):
+        # deeper than the recursion limit
+        root = part = _multipart('mixed')
+        for _ in range(5000):
+            sub = _multipart('mixed')
+            part.subParts = [sub]
+            part = sub
+
+        self.assertEqual(sum(1 for _ in root.walk_body()), 5001)
+
+
+class TestDeriveBodyParts(unittest.TestCase):
+    def test_derive_body_parts(self):
+        email = Email(body_structure=[
+            _multipart('mixed',
+                _multipart('alternative',
+                    _leaf('1', 'text/plain'),
+                    _leaf('2', 'text/html'),
+                ),
+                _leaf('3', 'image/png', disposition='inline'),
+                _leaf('4', 'application/pdf', disposition='attachment'),
+            ),
+        ])
+        email.derive_body_parts()
+
+        self.assertEqual([p.part_id for p in email.text_body], ['1', '3'])
+        self.assertEqual([p.part_id for p in email.html_body], ['2', '3'])
+        self.assertEqual([p.part_id for p in email.attachments], ['4'])
+        self.assertTrue(email.has_attachment)
+
+    def test_inline_attachments_only(self):
+        email = Email(body_structure=[
+            _multipart('related',
+                _leaf('1', 'text/html'),
+                _leaf('2', 'image/png', disposition='inline'),
+            ),
+        ])
+        email.derive_body_parts()
+
+        self.assertEqual([p.part_id for p in email.attachments], ['2'])
+        self.assertFalse(email.has_attachment)
+
+    def test_attached_message(self):
+        email = Email(body_structure=[
+            _multipart('mixed',
+                _leaf('1', 'text/plain'),
+                EmailBodyPart(part_id='2', type='message/rfc822',
+                                        subParts=[_leaf('3', 'text/plain')]),
+            ),
+        ])
+        email.derive_body_parts()
+
+        self.assertEqual([p.part_id for p in email.text_body], ['1'])
+        self.assertEqual([p.part_id for p in email.attachments], ['2'])
+        self.assertTrue(email.has_attachment)
+
+    def test_empty(self):
+        email = Email()
+        email.derive_body_parts()
+
+        self.assertEqual(email.text_body, [])
+        self.assertEqual(email.attachments, [])
+        self.assertFalse(email.has_attachment)
+
+
+if __name__ == '__main__':
+    unittest.main()
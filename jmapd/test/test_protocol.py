@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+#
+# This file is part of the jmapd project at https://github.com/arskom/jmapd.
+#
+# jmapd (c) 2020 and beyond, Arskom Ltd. All rights reserved.
+#
+# This file is subject to the terms of the 3-clause BSD license, which can be
+# found in the LICENSE file distributed with this file. Alternatively, you can
+# obtain a copy from the repository root cited above.
+#
+
+import json
+import unittest
+
+from unittest import mock
+
+from datetime import datetime, timedelta, timezone
+
+from spyne import Application, Service, rpc
+from spyne.error import ValidationError
+from spyne.protocol.json import JsonDocument
+
+from jmapd.model.core import CoreCapabilities
+from jmapd.model.mail import Email, EmailAddress, EmailBodyPart, \
+    EmailBodyValue, EmailHeader
+from jmapd.protocol import JmapJsonDocument, _is_string_array
+
+
+class _EmailService(Service):
+    @rpc(_returns=Email)
+    def get_email(ctx):
+        pass
+
+
+def _get_protocol(cls):
+    prot = cls(ignore_wrappers=True, default_string_encoding='utf8')
+    Application([_EmailService], 'tns', in_protocol=JsonDocument(),
+                                                             out_protocol=prot)
+    return prot
+
+
+def _get_email():
+    part = EmailBodyPart(part_id='1', blob_id='b1', size=3, type='text/plain',
+        headers=[EmailHeader(name='X-Test', value='v')], language=['en'],
+        subParts=[EmailBodyPart(part_id='2', size=1, type='text/html')])
+
+    return Email(id='e1', blob_id='b0', thread_id='t1', size=10,
+        mailbox_ids=frozenset(['m1']), keywords=frozenset(['$seen']),
+        message_id=['<a@b>'], references=['<c@d>', '<e@f>'],
+        sender=[EmailAddress(name='n', address='a@b')], subject='s',
+        received_at=datetime(2020, 1, 1), sent_at=datetime(2020, 1, 1),
+        body_structure=[part], body_values={'1': EmailBodyValue(value='v')},
+        text_body=[part], has_attachment=False, preview='p')
+
+
+class TestFastSerializer(unittest.TestCase):
+    # These are jmapd-specific types that JsonDocument can't serialize, they
+    # are tested separately.
+    SKIP = ('mailboxIds', 'keywords', 'bodyValues', 'receivedAt')
+
+    def assert_same(self, cls):
+        inst = _get_email()
+        fast = _get_protocol(JmapJsonDocument)
+        slow = _get_protocol(JsonDocument)
+
+        self.assertIsNotNone(fast._get_fast_serializer(cls))
+
+        got, expected = [self.to_json(prot, cls, inst) for prot in (fast, slow)]
+        self.assertEqual(got, expected)
+        return got
+
+    def to_json(self, prot, cls, inst):
+        doc = prot._object_to_doc(cls, inst)
+        for k in self.SKIP:
+            doc.pop(k, None)
+
+        return json.loads(json.dumps(doc, default=list))
+
+    def test_email(self):
+        self.assert_same(Email)
+
+    def test_customized_email(self):
+        cls = Email.customize(child_attrs=dict(
+            preview=dict(exc=True),
+            subject=dict(sub_name='SUBJ'),
+        ))
+
+        doc = self.assert_same(cls)
+        self.assertEqual(doc['SUBJ'], 's')
+        self.assertNotIn('subject', doc)
+        self.assertNotIn('preview', doc)
+
+
+class TestStringArray(unittest.TestCase):
+    def test_is_string_array(self):
+        for k in ('message_id', 'references', 'from_'):
+            self.assertTrue(_is_string_array(Email._type_info[k]), k)
+
+        self.assertFalse(_is_string_array(Email._type_info['subject']))
+
+    def test_same_as_json_document(self):
+        fast = _get_protocol(JmapJsonDocument)
+        slow = _get_protocol(JsonDocument)
+
+        for references in (['a', 'b'], ['a', None], [u'a', b'b']):
+            inst = Email(id='e1', references=references)
+
+            expected = list(slow._object_to_doc(Email, inst)['references'])
+            self.assertEqual(fast._object_to_doc(Email, inst)['references'],
+                                                                      expected)
+
+    def test_member_pairs(self):
+        # CoreCapabilities has no generated serializer, so this goes through
+        # _get_member_pairs.
+        fast = _get_protocol(JmapJsonDocument)
+        slow = _get_protocol(JsonDocument)
+        self.assertIsNone(fast._get_fast_serializer(CoreCapabilities))
+
+        for algorithms in (['C', 'i;ascii-casemap'], ['C', None], [b'C']):
+            inst = CoreCapabilities(collation_algorithms=algorithms)
+            got = fast._object_to_doc(CoreCapabilities, inst)
+            expected = slow._object_to_doc(CoreCapabilities, inst)
+            self.assertEqual(got['collationAlgorithms'],
+                                     list(expected['collationAlgorithms']))
+
+        # native strings are copied with list() instead of being passed to the
+        # protocol element by element.
+        inst = CoreCapabilities(collation_algorithms=('C',))
+        with mock.patch.object(fast, '_to_dict_value',
+                                      wraps=fast._to_dict_value) as to_dict:
+            doc = fast._object_to_doc(CoreCapabilities, inst)
+
+        self.assertEqual(doc['collationAlgorithms'], ['C'])
+        for call in to_dict.call_args_list:
+            self.assertNotEqual(call[0][1], 'C')
+
+    def test_bytes_are_decoded(self):
+        prot = _get_protocol(JmapJsonDocument)
+        inst = Email(id='e1', references=[b'\xc3\xa7'])
+        doc = prot._object_to_doc(Email, inst)
+        self.assertEqual(doc['references'], [u'\xe7'])
+
+
+class TestUtcDate(unittest.TestCase):
+    def test_utc_date(self):
+        prot = _get_protocol(JmapJsonDocument)
+        utc = datetime(2020, 1, 1, 10, 0)
+        east = (utc + timedelta(hours=3)).replace(
+                                             tzinfo=timezone(timedelta(hours=3)))
+
+        prot._use_orjson = False
+        for value in (utc, utc.replace(tzinfo=timezone.utc), east):
+            doc = prot._object_to_doc(Email, Email(id='e1', received_at=value))
+            self.assertEqual(doc['receivedAt'], '2020-01-01T10:00:00Z')
+
+        # orjson gets the datetime in UTC and adds the Z itself
+        prot._use_orjson = True
+        doc = prot._object_to_doc(Email, Email(id='e1', received_at=east))
+        self.assertEqual(doc['receivedAt'], utc.replace(tzinfo=timezone.utc))
+        self.assertEqual(doc['receivedAt'].utcoffset(), timedelta(0))
+
+
+class TestJmapSet(unittest.TestCase):
+    def from_dict(self, k, doc, validator='soft'):
+        prot = JmapJsonDocument(validator=validator)
+        return prot._from_dict_value(None, k, Email._type_info[k], doc,
+                                                                prot.validator)
+
+    def test_null(self):
+        for k in ('keywords', 'mailbox_ids'):
+            self.assertIsNone(self.from_dict(k, None))
+            self.assertIsNone(self.from_dict(k, None, validator=None))
+
+    def test_keywords(self):
+        self.assertEqual(self.from_dict('keywords', {'$Seen': True}),
+                                                          frozenset(['$seen']))
+
+        for doc in ({'bad(kw': True}, {'': True}, {'$seen': False}):
+            self.assertRaises(ValidationError, self.from_dict, 'keywords', doc)
+
+    def test_mailbox_ids(self):
+        self.assertEqual(self.from_dict('mailbox_ids', {'m1': True}),
+                                                              frozenset(['m1']))
+
+        for doc in ({'1m': True}, {'m' * 256: True}, {'m1': 1}):
+            self.assertRaises(ValidationError,
+                                          self.from_dict, 'mailbox_ids', doc)
+
+
+class TestJmapMap(unittest.TestCase):
+    def from_dict(self, doc):
+        prot = JmapJsonDocument(validator='soft')
+        return prot._from_dict_value(None, 'body_values',
+                        Email._type_info['body_values'], doc, prot.validator)
+
+    def test_omitted_defaults(self):
+        retval = self.from_dict({
+            '1': {'value': 'v'},
+            '2': {'value': 'w', 'isTruncated': True},
+        })
+
+        self.assertEqual(set(retval), {'1', '2'})
+        self.assertIsInstance(retval['1'], EmailBodyValue)
+        self.assertEqual(retval['1'].value, 'v')
+        self.assertIs(retval['1'].is_encoding_problem, False)
+        self.assertIs(retval['1'].is_truncated, False)
+        self.assertIs(retval['2'].is_truncated, True)
+
+    def test_doc_is_not_modified(self):
+        doc = {'1': {'value': 'v'}}
+        self.from_dict(doc)
+        self.assertEqual(doc, {'1': {'value': 'v'}})
+
+    def test_invalid(self):
+        for doc in (['v'], 'v', {'1': 'v'}, {'1': None}, {'1': ['v']},
+                                     {'1': {'value': 'v', 'isTruncated': 'x'}}):
+            self.assertRaises(ValidationError, self.from_dict, doc)
+
+    def test_null(self):
+        self.assertIsNone(self.from_dict(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
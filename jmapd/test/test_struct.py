@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+#
+# This file is part of the jmapd project at https://github.com/arskom/jmapd.
+#
+# jmapd (c) 2020 and beyond, Arskom Ltd. All rights reserved.
+#
+# This file is subject to the terms of the 3-clause BSD license, which can be
+# found in the LICENSE file distributed with this file. Alternatively, you can
+# obtain a copy from the repository root cited above.
+#
+
+import json
+import unittest
+
+from datetime import datetime
+
+from jmapd.model.core import Capabilities, CoreCapabilities
+from jmapd.model.mail import Email
+from jmapd.struct import msgspec, encode_json
+
+
+@unittest.skipIf(msgspec is None, "msgspec is not installed")
+class TestEncodeJson(unittest.TestCase):
+    def test_per_protocol_sub_name(self):
+        inst = Capabilities(core=CoreCapabilities(max_size_upload=5))
+        self.assertEqual(json.loads(encode_json(inst)), {
+            'urn:ietf:params:jmap:core': {'maxSizeUpload': 5},
+        })
+
+    def test_utc_date(self):
+        inst = Email(id='e1', received_at=datetime(2020, 1, 1, 10, 0))
+        doc = json.loads(encode_json(inst))
+        self.assertEqual(doc['receivedAt'], '2020-01-01T10:00:00Z')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,6 +17,20 @@ VERSION = re.compile(r".*__version__ *= *['\"](.*?)['\"]", re.S) \
 
 DEPENDENCIES = ('neurons',)
 
+# Set JMAPD_CYTHON=1 to compile the hot model modules with Cython. The result
+# is functionally identical to the pure-python package.
+EXT_MODULES = []
+if os.environ.get('JMAPD_CYTHON'):
+    from Cython.Build import cythonize
+
+    EXT_MODULES = cythonize([
+            'jmapd/model/_address.py',
+            'jmapd/model/_body.py',
+            'jmapd/model/_email.py',
+        ],
+        compiler_directives={'language_level': 3},
+    )
+
 setuptools.setup(
     name="jmapd",
     version=VERSION,
@@ -28,13 +42,14 @@ setuptools.setup(
     url="https://github.com/arskom/jmapd",
     packages=setuptools.find_packages(),
     install_requires=DEPENDENCIES,
+    ext_modules=EXT_MODULES,
     classifiers=[
-        "Programming Language :: Python :: 2.7",
         "Programming Language :: Python :: 3",
+        "Programming Language :: Python :: Implementation :: CPython",
         "License :: OSI Approved :: BSD License",
         "Operating System :: OS Independent",
     ],
-    python_requires='>=2.7',
+    python_requires='>=3.7',
     entry_points={
         'console_scripts': [
             'jmapd=jmapd.main:jmapd_main',